@@ -1,21 +1,33 @@
+import asyncio
+import codecs
+import collections
+import contextlib
+import functools
+import gzip
+import hashlib
+import hmac
 import json
 import os
 import shutil
+import signal
 import subprocess
-import uuid
+from typing import NamedTuple
 
+import aiofiles
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Header, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastmcp import FastMCP
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # ===================== 配置 =====================
 
-WORKSPACE = os.environ.get("WORKSPACE_DIR", "/workspace")
+WORKSPACE = os.path.abspath(os.environ.get("WORKSPACE_DIR", "/workspace"))
+WORKSPACE_SEP = WORKSPACE + os.sep
 os.makedirs(WORKSPACE, exist_ok=True)
 
 SANDBOX_TOKEN = os.environ.get("SANDBOX_TOKEN", "123456")
+SANDBOX_TOKEN_BYTES = SANDBOX_TOKEN.encode()
 
 LANGUAGE_RUNNERS = {
     "python": "python3", "python3": "python3", "py": "python3",
@@ -23,83 +35,429 @@ LANGUAGE_RUNNERS = {
     "node": "node", "javascript": "node", "js": "node",
 }
 
-LANGUAGE_EXTENSIONS = {
-    "python": ".py", "python3": ".py", "py": ".py",
-    "bash": ".sh", "sh": ".sh",
-    "node": ".js", "javascript": ".js", "js": ".js",
+# 解释器接收代码的方式：(参数, 代码写入的 fd)，经管道传入，省去写临时文件
+# python3/node 先读完整个 stdin 再执行；shell 边读边执行，脚本里读 stdin 的命令
+# 会吃掉后续代码，所以脚本走单独的 fd 3，stdin 接 /dev/null。
+# 不用 -c 传参：单个参数超过 128KB 时 exec 会报 Argument list too long
+SCRIPT_FD = 3
+LANGUAGE_CODE_ARGS = {
+    "python3": (["-"], 0),
+    "bash": ([f"/dev/fd/{SCRIPT_FD}"], SCRIPT_FD), "sh": ([f"/dev/fd/{SCRIPT_FD}"], SCRIPT_FD),
+    "node": (["-"], 0),
 }
 
+# Python 代码交给预热进程执行：进程池大小，以及预先导入的模块（逗号分隔）
+PYTHON_LANGUAGES = {"python", "python3", "py"}
+PYTHON_POOL_SIZE = int(os.environ.get("PYTHON_POOL_SIZE", 4))
+PYTHON_PRELOAD = [m for m in os.environ.get("PYTHON_PRELOAD", "numpy,pandas,json,re,io,base64").split(",") if m]
+
+# 启动时解析解释器绝对路径（spawn 时不再逐个搜索 PATH），与代码传入方式、是否走预热池合成一张表
+LANG_INFO = {
+    lang: (shutil.which(runner) or runner, *LANGUAGE_CODE_ARGS[runner], lang in PYTHON_LANGUAGES)
+    for lang, runner in LANGUAGE_RUNNERS.items()
+}
+SUPPORTED_LANGS_MSG = f"Supported: {sorted(LANGUAGE_RUNNERS)}"
+
+RM_BINARY = shutil.which("rm") or "rm"
+
+FILE_CHUNK_SIZE = 1 << 20
+# read_file 最多返回的字节数，完整内容请用 /read_raw 或 /read_stream
+READ_MAX_BYTES = int(os.environ.get("READ_MAX_BYTES", 1 << 20))
+# /execute_batch 单次最多提交的命令数，以及同时运行的命令数（每条命令占 3 个 pipe fd 和一个 pidfd）
+BATCH_MAX_COMMANDS = int(os.environ.get("BATCH_MAX_COMMANDS", 64))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 16))
+
 # ===================== 核心逻辑（框架无关）=====================
 
-def core_execute_command(command: str, timeout: int = 30) -> dict:
-    """执行 shell 命令"""
+class SpawnedChild(NamedTuple):
+    """posix_spawn 启动的子进程及其管道（父进程一端）"""
+    argv: list[str]
+    pid: int
+    stdin: int | None
+    stdout: int
+    stderr: int
+
+
+def _spawn(argv: list[str], stdin_pipe: bool = False, input_fd: int = 0) -> SpawnedChild:
+    """用 posix_spawn 启动子进程
+
+    相比 fork+exec 不复制父进程页表，服务进程越大启动越快。
+    stdin_pipe 为 True 时创建输入管道，接到子进程的 input_fd 上（SpawnedChild.stdin 为写端）；
+    输入管道不占用 fd 0 时 stdin 接 /dev/null。子进程独占一个进程组，便于超时后整组 kill。
+    """
+    # posix_spawn 不支持设置子进程 cwd，子进程继承服务进程的工作目录。每次启动前按路径重新切换，
+    # 工作区被删除重建后子进程进入的是新目录，而不是已删除的旧目录
+    os.chdir(WORKSPACE)
+    out_r, out_w = os.pipe2(os.O_CLOEXEC)
+    err_r, err_w = os.pipe2(os.O_CLOEXEC)
+    child_fds = [out_w, err_w]
+    in_w = None
+    file_actions = [
+        (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+        (os.POSIX_SPAWN_DUP2, out_w, 1),
+        (os.POSIX_SPAWN_DUP2, err_w, 2),
+    ]
+    if stdin_pipe:
+        in_r, in_w = os.pipe2(os.O_CLOEXEC)
+        child_fds.append(in_r)
+        # 放在最后：input_fd 可能与 out_w/err_w 的编号相同，要等它们先复制到 1/2
+        file_actions.append((os.POSIX_SPAWN_DUP2, in_r, input_fd))
     try:
-        result = subprocess.run(
-            command, shell=True, cwd=WORKSPACE,
-            capture_output=True, text=True, timeout=timeout,
-            encoding="utf-8", errors="replace",
+        pid = os.posix_spawnp(
+            argv[0], argv, os.environ,
+            file_actions=file_actions,
+            setpgroup=0,
+            # 与 subprocess 一致：恢复 Python 忽略掉的信号
+            setsigdef=(signal.SIGPIPE, signal.SIGXFSZ),
         )
-        return {"stdout": result.stdout, "stderr": result.stderr, "exit_code": result.returncode}
+    except BaseException:
+        for fd in (out_r, err_r, in_w):
+            if fd is not None:
+                os.close(fd)
+        raise
+    finally:
+        for fd in child_fds:
+            os.close(fd)
+    return SpawnedChild(argv, pid, in_w, out_r, err_r)
+
+
+class ChildReaper:
+    """进程级的子进程回收器
+
+    所有子进程的 pidfd 都注册在事件循环的 epoll 上，子进程退出时一次唤醒即回收，
+    不为每个子进程占用线程。超时 kill 和回收都在这里完成，与请求协程解耦：
+    请求被取消后子进程同样会被杀掉并回收，不会留下僵尸进程。
+    """
+
+    def __init__(self):
+        # pid -> (pidfd, 结果 future, 超时定时器)
+        self.children: dict[int, tuple[int | None, asyncio.Future, asyncio.TimerHandle | None]] = {}
+        self.timed_out: set[int] = set()
+
+    def watch(self, pid: int, timeout: float | None = None) -> asyncio.Future:
+        """开始跟踪子进程，返回的 future 在回收后得到 (exit_code, 是否超时被杀)，等待失败时带上异常"""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        deadline = loop.call_later(timeout, self._expire, pid) if timeout is not None else None
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            # 内核不支持 pidfd（< 5.3）：退回到线程池里阻塞等待。WNOWAIT 只等退出不回收，
+            # 回收留到事件循环线程上出队时再做，pid 在此之前不会被复用，killpg 不会误杀
+            pidfd = None
+            waiter = loop.run_in_executor(None, os.waitid, os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+            waiter.add_done_callback(functools.partial(self._on_waited, pid))
+        else:
+            loop.add_reader(pidfd, self._reap, pid, pidfd)
+        self.children[pid] = (pidfd, fut, deadline)
+        return fut
+
+    def kill(self, pid: int) -> None:
+        """SIGKILL 仍未回收的子进程所在的整个进程组"""
+        if pid in self.children:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(pid, signal.SIGKILL)
+
+    def _expire(self, pid: int) -> None:
+        self.timed_out.add(pid)
+        self.kill(pid)
+
+    def _reap(self, pid: int, pidfd: int) -> None:
+        try:
+            result = os.waitid(os.P_PIDFD, pidfd, os.WEXITED | os.WNOHANG)
+        except OSError as e:
+            self._fail(pid, e)
+            return
+        if result is None:
+            return
+        exit_code = result.si_status if result.si_code == os.CLD_EXITED else -result.si_status
+        self._finish(pid, exit_code)
+
+    def _on_waited(self, pid: int, waiter: asyncio.Future) -> None:
+        try:
+            waiter.result()
+            _, status = os.waitpid(pid, 0)
+        except Exception as e:
+            self._fail(pid, e)
+            return
+        self._finish(pid, os.waitstatus_to_exitcode(status))
+
+    def _release(self, pid: int) -> tuple[asyncio.Future, bool]:
+        """停止跟踪子进程，返回它的 future 和是否超时被杀"""
+        pidfd, fut, deadline = self.children.pop(pid)
+        if pidfd is not None:
+            fut.get_loop().remove_reader(pidfd)
+            os.close(pidfd)
+        if deadline is not None:
+            deadline.cancel()
+        timed_out = pid in self.timed_out
+        self.timed_out.discard(pid)
+        return fut, timed_out
+
+    def _finish(self, pid: int, exit_code: int) -> None:
+        fut, timed_out = self._release(pid)
+        fut.set_result((exit_code, timed_out))
+
+    def _fail(self, pid: int, exc: Exception) -> None:
+        # 等待子进程失败：结束等待方，不让请求一直挂着
+        fut, _ = self._release(pid)
+        fut.set_exception(exc)
+
+
+child_reaper = ChildReaper()
+
+
+async def _communicate(
+    child: SpawnedChild, input: bytes | None = None, timeout: int | None = None,
+) -> tuple[int, bytes, bytes]:
+    """向子进程 stdin 写入 input 并收集 stdout/stderr，返回 (exit_code, stdout, stderr)
+
+    管道直接挂在事件循环上读写，不占用线程池。结束后关闭 child 的所有管道。
+    超时后整组 SIGKILL，并抛出 subprocess.TimeoutExpired。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+    in_w = child.stdin
+    bufs = {child.stdout: bytearray(), child.stderr: bytearray()}
+    eofs = []
+
+    def on_readable(fd: int, eof: asyncio.Future) -> None:
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        if chunk:
+            bufs[fd] += chunk
+        else:
+            loop.remove_reader(fd)
+            eof.set_result(None)
+
+    for fd in bufs:
+        os.set_blocking(fd, False)
+        eof = loop.create_future()
+        loop.add_reader(fd, on_readable, fd, eof)
+        eofs.append(eof)
+
+    if in_w is not None:
+        pending_input = memoryview(input or b"")
+
+        def on_writable() -> None:
+            nonlocal pending_input, in_w
+            try:
+                written = os.write(in_w, pending_input)
+            except BlockingIOError:
+                return
+            except BrokenPipeError:
+                # 子进程没读完 stdin 就退出了，丢弃剩余部分
+                written = len(pending_input)
+            pending_input = pending_input[written:]
+            if not pending_input:
+                loop.remove_writer(in_w)
+                os.close(in_w)
+                in_w = None
+
+        os.set_blocking(in_w, False)
+        loop.add_writer(in_w, on_writable)
+
+    exited = child_reaper.watch(child.pid, timeout)
+    try:
+        exit_code, timed_out = await asyncio.shield(exited)
+        if not timed_out:
+            # 子进程已退出，但它留下的后台进程可能还占着管道，最多等到截止时间
+            remaining = max(deadline - loop.time(), 0) if deadline is not None else None
+            _, pending = await asyncio.wait(eofs, timeout=remaining)
+            if pending:
+                timed_out = True
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(child.pid, signal.SIGKILL)
+    finally:
+        if not exited.done():
+            # 请求被取消：杀掉子进程，由 child_reaper 负责回收
+            child_reaper.kill(child.pid)
+        for fd in bufs:
+            loop.remove_reader(fd)
+            os.close(fd)
+        if in_w is not None:
+            loop.remove_writer(in_w)
+            os.close(in_w)
+
+    if timed_out:
+        raise subprocess.TimeoutExpired(child.argv, timeout)
+    return exit_code, bytes(bufs[child.stdout]), bytes(bufs[child.stderr])
+
+
+async def _spawn_capture(
+    argv: list[str], timeout: int | None = None, input: bytes | None = None, input_fd: int = 0,
+) -> tuple[int, bytes, bytes]:
+    """启动子进程并捕获输出；input 不为 None 时经管道写入子进程的 input_fd（默认 stdin）"""
+    child = _spawn(argv, stdin_pipe=input is not None, input_fd=input_fd)
+    return await _communicate(child, input, timeout)
+
+
+class WarmRunnerPool:
+    """预先启动的解释器进程池
+
+    空闲进程阻塞在读 stdin 上，解释器启动和库导入在请求到来之前就已完成，
+    执行代码只剩一次管道读写。每个进程只执行一段代码，取出后立即补充新进程，
+    多次执行之间不共享任何状态。
+
+    预热进程导入完成后向 stdout 写一个字节表示就绪，只有就绪的进程才会被取出；
+    没有就绪进程时用 cold_argv 冷启动一个不预导入的解释器，不让请求等待导入。
+    """
+
+    def __init__(self, argv: list[str], cold_argv: list[str], size: int):
+        self.argv = argv
+        self.cold_argv = cold_argv
+        self.size = size
+        self.idle: collections.deque[SpawnedChild] = collections.deque()
+        self.starting: dict[int, SpawnedChild] = {}
+
+    def fill(self) -> None:
+        loop = asyncio.get_running_loop()
+        while len(self.idle) + len(self.starting) < self.size:
+            child = _spawn(self.argv, stdin_pipe=True)
+            self.starting[child.pid] = child
+            os.set_blocking(child.stdout, False)
+            loop.add_reader(child.stdout, self._on_ready, loop, child)
+
+    def _on_ready(self, loop: asyncio.AbstractEventLoop, child: SpawnedChild) -> None:
+        try:
+            ready = os.read(child.stdout, 1)
+        except BlockingIOError:
+            return
+        loop.remove_reader(child.stdout)
+        del self.starting[child.pid]
+        if ready:
+            self.idle.append(child)
+            return
+        # 预热阶段就退出了（比如被沙盒里的命令杀掉）：交给 child_reaper 回收
+        child_reaper.watch(child.pid)
+        child_reaper.kill(child.pid)
+        for fd in (child.stdin, child.stdout, child.stderr):
+            os.close(fd)
+
+    def _checkout(self) -> SpawnedChild | None:
+        while self.idle:
+            child = self.idle.popleft()
+            if os.waitid(os.P_PID, child.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+                return child
+            # 空闲进程已退出（比如被沙盒里的命令杀掉），回收后取下一个
+            os.waitpid(child.pid, 0)
+            for fd in (child.stdin, child.stdout, child.stderr):
+                os.close(fd)
+        return None
+
+    async def run(self, code: bytes, timeout: int | None = None) -> tuple[int, bytes, bytes]:
+        child = self._checkout()
+        with contextlib.suppress(OSError):
+            self.fill()
+        if child is None:
+            return await _spawn_capture(self.cold_argv, timeout, input=code)
+        return await _communicate(child, code, timeout)
+
+
+def _resolve(path: str, _prefix: str = WORKSPACE_SEP) -> str:
+    """相对路径拼到 WORKSPACE 下，绝对路径原样返回"""
+    return path if path[:1] == os.sep else _prefix + path
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace")
+
+
+# 预热进程先导入 PYTHON_PRELOAD，写出就绪字节，再从 stdin 读取并执行代码。
+# 执行环境与 python3 - 保持一致：argv、__main__ 模块、__file__，回溯中也不出现这层包装代码。
+# 预热进程可能早于工作区重建启动，拿到代码后再按路径切换一次工作目录
+PYTHON_WORKER_PRELUDE = f"""
+import os, sys, types
+for _name in {PYTHON_PRELOAD!r}:
+    try:
+        __import__(_name)
+    except ImportError:
+        pass
+sys.argv = ["-"]
+def _excepthook(t, e, tb):
+    if tb is not None:
+        tb = tb.tb_next
+        e = e.with_traceback(tb)
+    sys.__excepthook__(t, e, tb)
+sys.excepthook = _excepthook
+_main = sys.modules["__main__"] = types.ModuleType("__main__")
+_main.__file__ = "<stdin>"
+os.write(1, b"\\0")
+_code = sys.stdin.buffer.read()
+os.chdir({WORKSPACE!r})
+exec(compile(_code, "<stdin>", "exec"), _main.__dict__)
+"""
+
+_python_runner, _python_args, _, _ = LANG_INFO["python"]
+python_pool = WarmRunnerPool(
+    [_python_runner, "-c", PYTHON_WORKER_PRELUDE], [_python_runner, *_python_args], PYTHON_POOL_SIZE,
+)
+
+
+async def core_execute_command(command: str, timeout: int = 30) -> dict:
+    """执行 shell 命令"""
+    try:
+        exit_code, stdout, stderr = await _spawn_capture(["/bin/sh", "-c", command], timeout)
+        return {"stdout": _decode(stdout), "stderr": _decode(stderr), "exit_code": exit_code}
     except subprocess.TimeoutExpired:
         return {"stdout": "", "stderr": "Command timed out", "exit_code": -1}
     except Exception as e:
         return {"stdout": "", "stderr": str(e), "exit_code": -1}
 
 
-def core_run_code(language: str, code: str, timeout: int = 30) -> dict:
-    """写入临时文件并执行代码"""
-    lang = language.lower()
-    if lang not in LANGUAGE_RUNNERS:
+async def core_run_code(language: str, code: str, timeout: int = 30) -> dict:
+    """执行代码：Python 交给预热进程池，其他语言经管道传给解释器"""
+    info = LANG_INFO.get(language) or LANG_INFO.get(language.lower())
+    if info is None:
         return {
             "stdout": "",
-            "stderr": f"Unsupported language: {language}. Supported: {list(LANGUAGE_RUNNERS.keys())}",
+            "stderr": f"Unsupported language: {language}. {SUPPORTED_LANGS_MSG}",
             "exit_code": -1,
         }
 
-    runner = LANGUAGE_RUNNERS[lang]
-    ext = LANGUAGE_EXTENSIONS[lang]
-    temp_filename = f"_run_{uuid.uuid4().hex[:8]}{ext}"
-    temp_path = os.path.join(WORKSPACE, temp_filename)
-
+    runner, code_args, input_fd, warm = info
     try:
-        with open(temp_path, "w", encoding="utf-8") as f:
-            f.write(code)
-
-        result = subprocess.run(
-            f"{runner} {temp_filename}", shell=True, cwd=WORKSPACE,
-            capture_output=True, text=True, timeout=timeout,
-            encoding="utf-8", errors="replace",
-        )
-        return {
-            "stdout": result.stdout, "stderr": result.stderr,
-            "exit_code": result.returncode, "temp_file": temp_filename,
-        }
+        if warm:
+            exit_code, stdout, stderr = await python_pool.run(code.encode("utf-8"), timeout)
+        else:
+            exit_code, stdout, stderr = await _spawn_capture(
+                [runner, *code_args], timeout, input=code.encode("utf-8"), input_fd=input_fd,
+            )
+        return {"stdout": _decode(stdout), "stderr": _decode(stderr), "exit_code": exit_code}
     except subprocess.TimeoutExpired:
         return {"stdout": "", "stderr": "Code execution timed out", "exit_code": -1}
     except Exception as e:
         return {"stdout": "", "stderr": str(e), "exit_code": -1}
 
 
-def core_write_file(path: str, content: str) -> dict:
+async def core_write_file(path: str, content: str) -> dict:
     """写入文件"""
     try:
-        full_path = path if os.path.isabs(path) else os.path.join(WORKSPACE, path)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        full_path = _resolve(path)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(full_path), exist_ok=True)
+        async with aiofiles.open(full_path, "w", encoding="utf-8") as f:
+            await f.write(content)
         return {"status": "success", "path": os.path.relpath(full_path, WORKSPACE)}
     except Exception as e:
         return {"status": "error", "detail": str(e)}
 
 
-def core_read_file(path: str) -> dict:
-    """读取文件"""
+async def core_read_file(path: str) -> dict:
+    """读取文件，超过 READ_MAX_BYTES 的部分截断"""
     try:
-        full_path = path if os.path.isabs(path) else os.path.join(WORKSPACE, path)
-        if not os.path.exists(full_path):
+        full_path = _resolve(path)
+        if not await asyncio.to_thread(os.path.exists, full_path):
             return {"content": None, "error": "File not found"}
-        with open(full_path, "r", encoding="utf-8", errors="replace") as f:
-            return {"content": f.read()}
+        # 先按字节截断再解码，大文件不会整体解码再整体转义成 JSON
+        async with aiofiles.open(full_path, "rb") as f:
+            data = await f.read(READ_MAX_BYTES + 1)
+        if len(data) <= READ_MAX_BYTES:
+            return {"content": _decode(data), "truncated": False}
+        # 截断处可能落在多字节字符中间：增量解码器不输出末尾不完整的字符，避免结尾出现 U+FFFD
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        return {"content": decoder.decode(data[:READ_MAX_BYTES], final=False), "truncated": True}
     except Exception as e:
         return {"content": None, "error": str(e)}
 
@@ -117,7 +475,7 @@ mcp = FastMCP(
 
 
 @mcp.tool
-def execute_command(command: str, timeout: int = 30) -> str:
+async def execute_command(command: str, timeout: int = 30) -> str:
     """在沙盒中执行 shell 命令。
 
     可以执行任意 Linux 命令，如 ls、pip install、curl、git 等。
@@ -127,15 +485,15 @@ def execute_command(command: str, timeout: int = 30) -> str:
         command: 要执行的 shell 命令
         timeout: 超时时间（秒），默认 30
     """
-    result = core_execute_command(command, timeout)
+    result = await core_execute_command(command, timeout)
     return json.dumps(result, ensure_ascii=False)
 
 
 @mcp.tool
-def run_code(language: str, code: str, timeout: int = 30) -> str:
+async def run_code(language: str, code: str, timeout: int = 30) -> str:
     """在沙盒中执行代码片段。
 
-    自动创建临时文件并执行，无需手动写文件。
+    代码直接交给解释器执行，无需手动写文件。
     支持的语言: python, bash, node (javascript)
 
     Args:
@@ -143,12 +501,12 @@ def run_code(language: str, code: str, timeout: int = 30) -> str:
         code: 要执行的代码内容
         timeout: 超时时间（秒），默认 30
     """
-    result = core_run_code(language, code, timeout)
+    result = await core_run_code(language, code, timeout)
     return json.dumps(result, ensure_ascii=False)
 
 
 @mcp.tool
-def write_file(path: str, content: str) -> str:
+async def write_file(path: str, content: str) -> str:
     """将内容写入沙盒中的文件。
 
     支持相对路径（相对于 /workspace）和绝对路径。
@@ -158,20 +516,21 @@ def write_file(path: str, content: str) -> str:
         path: 文件路径（相对于 /workspace 或绝对路径）
         content: 要写入的文件内容
     """
-    result = core_write_file(path, content)
+    result = await core_write_file(path, content)
     return json.dumps(result, ensure_ascii=False)
 
 
 @mcp.tool
-def read_file(path: str) -> str:
+async def read_file(path: str) -> str:
     """读取沙盒中的文件内容。
 
     支持相对路径（相对于 /workspace）和绝对路径。
+    文件超过读取上限（由 READ_MAX_BYTES 配置）时只返回开头部分，并标记 truncated。
 
     Args:
         path: 文件路径（相对于 /workspace 或绝对路径）
     """
-    result = core_read_file(path)
+    result = await core_read_file(path)
     return json.dumps(result, ensure_ascii=False)
 
 
@@ -179,8 +538,15 @@ def read_file(path: str) -> str:
 
 api = FastAPI(title="AI Sandbox")
 
+
+@functools.lru_cache(maxsize=1024)
+def is_valid_token(token: str | None) -> bool:
+    """常量时间比较 token；token 固定不变，结果按请求头的值缓存"""
+    return hmac.compare_digest(token.encode() if token else b"", SANDBOX_TOKEN_BYTES)
+
+
 async def verify_token(x_sandbox_token: str = Header(None)):
-    if x_sandbox_token != SANDBOX_TOKEN:
+    if not is_valid_token(x_sandbox_token):
         raise HTTPException(status_code=403, detail="Invalid X-Sandbox-Token")
 
 
@@ -188,6 +554,9 @@ class ExecuteRequest(BaseModel):
     command: str
     timeout: int = 30
 
+class BatchExecRequest(BaseModel):
+    commands: list[ExecuteRequest] = Field(max_length=BATCH_MAX_COMMANDS)
+
 class WriteFileRequest(BaseModel):
     path: str
     content: str
@@ -204,16 +573,31 @@ def read_root():
 
 
 @api.post("/execute", dependencies=[Depends(verify_token)])
-def api_execute(req: ExecuteRequest):
-    result = core_execute_command(req.command, req.timeout)
+async def api_execute(req: ExecuteRequest):
+    result = await core_execute_command(req.command, req.timeout)
     if result["exit_code"] == -1 and "timed out" in result["stderr"]:
         raise HTTPException(status_code=408, detail="Command timed out")
     return result
 
 
+# 所有批量请求共用的并发上限，避免一次性 spawn 过多子进程耗尽 fd
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+
+@api.post("/execute_batch", dependencies=[Depends(verify_token)])
+async def api_execute_batch(req: BatchExecRequest):
+    """并发执行多条命令，结果按提交顺序返回；超时只体现在对应条目的结果中"""
+    async def run(c: ExecuteRequest) -> dict:
+        async with batch_semaphore:
+            return await core_execute_command(c.command, c.timeout)
+
+    results = await asyncio.gather(*(run(c) for c in req.commands))
+    return {"results": results}
+
+
 @api.post("/run_code", dependencies=[Depends(verify_token)])
-def api_run_code(req: RunCodeRequest):
-    result = core_run_code(req.language, req.code, req.timeout)
+async def api_run_code(req: RunCodeRequest):
+    result = await core_run_code(req.language, req.code, req.timeout)
     if result["exit_code"] == -1 and "Unsupported language" in result["stderr"]:
         raise HTTPException(status_code=400, detail=result["stderr"])
     if result["exit_code"] == -1 and "timed out" in result["stderr"]:
@@ -222,46 +606,78 @@ def api_run_code(req: RunCodeRequest):
 
 
 @api.post("/write", dependencies=[Depends(verify_token)])
-def api_write_file(req: WriteFileRequest):
-    result = core_write_file(req.path, req.content)
+async def api_write_file(req: WriteFileRequest):
+    result = await core_write_file(req.path, req.content)
     if result["status"] == "error":
         raise HTTPException(status_code=500, detail=result["detail"])
     return result
 
 
 @api.get("/read", dependencies=[Depends(verify_token)])
-def api_read_file(path: str):
-    result = core_read_file(path)
+async def api_read_file(path: str):
+    result = await core_read_file(path)
     if result.get("error"):
         status = 404 if result["error"] == "File not found" else 500
         raise HTTPException(status_code=status, detail=result["error"])
     return result
 
 
+@api.get("/read_raw", dependencies=[Depends(verify_token)])
+async def api_read_raw(path: str):
+    """原样返回文件内容，不解码、不截断"""
+    full_path = _resolve(path)
+    if not await asyncio.to_thread(os.path.isfile, full_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(full_path)
+
+
+@api.get("/read_stream", dependencies=[Depends(verify_token)])
+async def api_read_stream(path: str):
+    """按 1MB 分块流式返回文件内容，读到第一块就开始发送"""
+    full_path = _resolve(path)
+    if not await asyncio.to_thread(os.path.isfile, full_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    def iter_file():
+        with open(full_path, "rb") as f:
+            while chunk := f.read(FILE_CHUNK_SIZE):
+                yield chunk
+
+    return StreamingResponse(iter_file(), media_type="application/octet-stream")
+
+
 # ===================== WebUI 专用端点 =====================
 
 @api.get("/list", dependencies=[Depends(verify_token)])
 def list_dir(path: str = "."):
     """列出目录内容"""
     try:
-        full_path = path if os.path.isabs(path) else os.path.join(WORKSPACE, path)
+        full_path = _resolve(path)
         if not os.path.exists(full_path):
             raise HTTPException(status_code=404, detail="Path not found")
         if not os.path.isdir(full_path):
             raise HTTPException(status_code=400, detail="Path is not a directory")
 
-        items = []
-        for name in os.listdir(full_path):
-            item_path = os.path.join(full_path, name)
-            stat = os.stat(item_path)
-            items.append({
-                "name": name,
-                "type": "dir" if os.path.isdir(item_path) else "file",
-                "size": stat.st_size,
-                "modified": stat.st_mtime,
-            })
-        items.sort(key=lambda x: (0 if x["type"] == "dir" else 1, x["name"].lower()))
-        return {"path": full_path, "items": items}
+        # scandir 自带 d_type，is_dir() 无需额外 stat；目录不返回大小和时间，整个跳过 stat
+        dirs, files = [], []
+        with os.scandir(full_path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                else:
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_size, stat.st_mtime))
+        dirs.sort(key=str.lower)
+        files.sort(key=lambda f: f[0].lower())
+        # 按列返回：每个字段名只出现一次，types 中 d 为目录、f 为文件
+        padding = [None] * len(dirs)
+        return {
+            "path": full_path,
+            "names": dirs + [f[0] for f in files],
+            "types": "d" * len(dirs) + "f" * len(files),
+            "sizes": padding + [f[1] for f in files],
+            "mtimes": padding + [f[2] for f in files],
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -269,16 +685,19 @@ def list_dir(path: str = "."):
 
 
 @api.delete("/delete", dependencies=[Depends(verify_token)])
-def delete_path(path: str):
+async def delete_path(path: str):
     """删除文件或目录"""
     try:
-        full_path = path if os.path.isabs(path) else os.path.join(WORKSPACE, path)
-        if not os.path.exists(full_path):
+        full_path = _resolve(path)
+        if not await asyncio.to_thread(os.path.exists, full_path):
             raise HTTPException(status_code=404, detail="Path not found")
-        if os.path.isdir(full_path):
-            shutil.rmtree(full_path)
+        if await asyncio.to_thread(os.path.isdir, full_path):
+            # 大目录交给子进程里的 rm -rf，等待期间既不占事件循环也不占线程池
+            exit_code, _, stderr = await _spawn_capture([RM_BINARY, "-rf", "--", full_path])
+            if exit_code != 0:
+                raise HTTPException(status_code=500, detail=_decode(stderr).strip() or f"rm exited with {exit_code}")
         else:
-            os.remove(full_path)
+            await asyncio.to_thread(os.remove, full_path)
         return {"status": "success", "deleted": full_path}
     except HTTPException:
         raise
@@ -290,7 +709,7 @@ def delete_path(path: str):
 async def upload_file(file: UploadFile = File(...), subdir: str = Form("")):
     """接收二进制文件上传"""
     try:
-        target_dir = os.path.join(WORKSPACE, subdir) if subdir else WORKSPACE
+        target_dir = _resolve(subdir) if subdir else WORKSPACE
         os.makedirs(target_dir, exist_ok=True)
 
         filename = file.filename or "uploaded_file"
@@ -302,12 +721,16 @@ async def upload_file(file: UploadFile = File(...), subdir: str = Form("")):
                 target_path = os.path.join(target_dir, f"{name}_{counter}{ext}")
                 counter += 1
 
-        content = await file.read()
-        with open(target_path, "wb") as f:
-            f.write(content)
+        def save() -> int:
+            # 按 1MB 分块拷贝，内存占用与文件大小无关
+            with open(target_path, "wb") as f:
+                shutil.copyfileobj(file.file, f, FILE_CHUNK_SIZE)
+                return f.tell()
+
+        size = await asyncio.to_thread(save)
 
         rel_path = os.path.relpath(target_path, WORKSPACE)
-        return {"path": rel_path, "size": len(content)}
+        return {"path": rel_path, "size": size}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -494,6 +917,19 @@ FILE_MANAGER_HTML = """
     <script>
         let TOKEN = localStorage.getItem('sandbox_token') || '';
         let currentPath = '/workspace';
+        const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+        // 列表和面包屑各用一个委托监听器，不给每一项绑定 onclick
+        document.getElementById('file-list-content').addEventListener('click', e => {
+            const item = e.target.closest('.file-item');
+            if (!item) return;
+            if (item.dataset.action === 'up') goUp();
+            else if (e.target.closest('.btn-delete')) deleteItem(item.dataset.path);
+            else handleItemClick(item);
+        });
+        document.getElementById('breadcrumb').addEventListener('click', e => {
+            const link = e.target.closest('a[data-path]');
+            if (link) loadDirectory(link.dataset.path);
+        });
         if (TOKEN) { verifyAndEnter(); }
 
         async function login() {
@@ -528,34 +964,35 @@ FILE_MANAGER_HTML = """
                 const res = await fetchAPI(`/list?path=${encodeURIComponent(path)}`);
                 const data = await res.json();
                 if (!res.ok) { listEl.innerHTML = `<div class="error">${data.detail || 'Load failed'}</div>`; return; }
-                if (data.items.length === 0) { listEl.innerHTML = '<div class="loading">Empty directory</div>'; return; }
-                let html = '';
+                const count = data.names.length;
+                if (count === 0) { listEl.innerHTML = '<div class="loading">Empty directory</div>'; return; }
+                const rows = [];
                 if (path !== '/workspace' && path !== '/') {
-                    html += `<div class="file-item" onclick="goUp()"><span class="file-icon">⬆️</span><span class="file-name">..</span></div>`;
+                    rows.push('<div class="file-item" data-action="up"><span class="file-icon">⬆️</span><span class="file-name">..</span></div>');
                 }
-                for (const item of data.items) {
-                    const icon = item.type === 'dir' ? '📁' : getFileIcon(item.name);
-                    const size = item.type === 'dir' ? '' : formatSize(item.size);
-                    const itemPath = path + '/' + item.name;
-                    html += `<div class="file-item" data-path="${escapeHtml(itemPath)}" data-type="${item.type}" onclick="handleItemClick(this)">
-                        <span class="file-icon">${icon}</span><span class="file-name">${escapeHtml(item.name)}</span>
+                for (let i = 0; i < count; i++) {
+                    const name = data.names[i], isDir = data.types[i] === 'd';
+                    const icon = isDir ? '📁' : getFileIcon(name);
+                    const size = isDir ? '' : formatSize(data.sizes[i]);
+                    rows.push(`<div class="file-item" data-path="${escapeHtml(path + '/' + name)}" data-type="${isDir ? 'dir' : 'file'}">
+                        <span class="file-icon">${icon}</span><span class="file-name">${escapeHtml(name)}</span>
                         <span class="file-size">${size}</span>
-                        <div class="file-actions"><button class="btn-delete" onclick="event.stopPropagation();deleteItem('${escapeHtml(itemPath)}')">Delete</button></div>
-                    </div>`;
+                        <div class="file-actions"><button class="btn-delete">Delete</button></div>
+                    </div>`);
                 }
-                listEl.innerHTML = html;
+                listEl.innerHTML = rows.join('');
             } catch (e) { listEl.innerHTML = `<div class="error">Request failed: ${e.message}</div>`; }
         }
         function updateBreadcrumb() {
             const parts = currentPath.split('/').filter(p => p);
-            let html = '<a onclick="loadDirectory(\'/\')">🏠</a>';
+            const crumbs = ['<a data-path="/">🏠</a>'];
             let accPath = '';
             for (let i = 0; i < parts.length; i++) {
                 accPath += '/' + parts[i];
-                html += '<span>/</span>';
-                html += i === parts.length - 1 ? `<span>${escapeHtml(parts[i])}</span>` : `<a onclick="loadDirectory('${escapeHtml(accPath)}')">${escapeHtml(parts[i])}</a>`;
+                crumbs.push('<span>/</span>');
+                crumbs.push(i === parts.length - 1 ? `<span>${escapeHtml(parts[i])}</span>` : `<a data-path="${escapeHtml(accPath)}">${escapeHtml(parts[i])}</a>`);
             }
-            document.getElementById('breadcrumb').innerHTML = html;
+            document.getElementById('breadcrumb').innerHTML = crumbs.join('');
         }
         function goUp() {
             const parts = currentPath.split('/').filter(p => p); parts.pop();
@@ -597,15 +1034,64 @@ FILE_MANAGER_HTML = """
             if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + ' KB';
             return (bytes / 1024 / 1024).toFixed(1) + ' MB';
         }
-        function escapeHtml(str) { return String(str).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;').replace(/"/g,'&quot;').replace(/'/g,'&#39;'); }
+        function escapeHtml(str) { return String(str).replace(/[&<>"']/g, c => HTML_ESCAPES[c]); }
     </script>
 </body>
 </html>
 """
 
+# 页面是常量：编码、gzip 压缩和 ETag 只在启动时算一次
+FILE_MANAGER_HTML_BYTES = FILE_MANAGER_HTML.encode("utf-8")
+FILE_MANAGER_HTML_GZIP = gzip.compress(FILE_MANAGER_HTML_BYTES, compresslevel=9)
+FILE_MANAGER_HTML_ETAG = hashlib.md5(FILE_MANAGER_HTML_BYTES).hexdigest()
+FILE_MANAGER_HTML_HEADERS = {
+    "ETag": f'"{FILE_MANAGER_HTML_ETAG}"',
+    "Cache-Control": "public, max-age=3600",
+    "Vary": "Accept-Encoding",
+}
+FILE_MANAGER_HTML_GZIP_HEADERS = {
+    **FILE_MANAGER_HTML_HEADERS,
+    "ETag": f'"{FILE_MANAGER_HTML_ETAG}-gzip"',
+    "Content-Encoding": "gzip",
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _accepts_gzip(accept_encoding: str | None) -> bool:
+    """按 Accept-Encoding 判断客户端是否接受 gzip：q=0 表示拒绝，* 作用于未单独列出的编码"""
+    if not accept_encoding:
+        return False
+    wildcard = False
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if coding not in ("gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == "gzip":
+            return q > 0
+        wildcard = q > 0
+    return wildcard
+
+
 @api.get("/ui", response_class=HTMLResponse)
-def file_manager_ui():
-    return FILE_MANAGER_HTML
+async def file_manager_ui(
+    if_none_match: str | None = Header(None), accept_encoding: str | None = Header(None),
+):
+    if _accepts_gzip(accept_encoding):
+        content, headers = FILE_MANAGER_HTML_GZIP, FILE_MANAGER_HTML_GZIP_HEADERS
+    else:
+        content, headers = FILE_MANAGER_HTML_BYTES, FILE_MANAGER_HTML_HEADERS
+    if if_none_match and headers["ETag"] in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="text/html; charset=utf-8", headers=headers)
 
 
 # 静态文件挂载到 FastAPI
@@ -624,14 +1110,20 @@ class App:
 
     async def __call__(self, scope, receive, send):
         if scope["type"] == "lifespan":
-            await mcp_starlette(scope, receive, send)
+            async def receive_with_startup():
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    python_pool.fill()
+                return message
+
+            await mcp_starlette(scope, receive_with_startup, send)
             return
 
         if scope["type"] == "http" and scope["path"].startswith("/mcp"):
             # MCP 端点鉴权
             headers = dict(scope.get("headers", []))
             token = headers.get(b"x-sandbox-token", b"").decode()
-            if token != SANDBOX_TOKEN:
+            if not is_valid_token(token):
                 resp = JSONResponse(status_code=403, content={"detail": "Invalid X-Sandbox-Token"})
                 await resp(scope, receive, send)
                 return
@@ -641,3 +1133,19 @@ class App:
 
 
 app = App()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 7860)),
+        loop="uvloop",
+        http="httptools",
+        # 每个 worker 进程都有自己的 Python 预热池（PYTHON_POOL_SIZE 个预导入 pandas 的解释器），
+        # 多 worker 时常驻进程数和内存按 worker 数成倍增长，默认只开一个
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+        log_level="warning",
+    )